@@ -1,3 +1,6 @@
+import math
+
+
 class MC:
     """
         Mock mc class to simulate crazyflie's motion controller behaviour
@@ -25,4 +28,90 @@ class MC:
 
     @staticmethod
     def turn_right(s, velocity=0):
-        print("mc: turn right")
\ No newline at end of file
+        print("mc: turn right")
+
+
+class VirtualClock:
+    """
+        Simulated time: sleeping advances the clock instantly
+    """
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class VirtualMC:
+    """
+        Motion controller that flies on a virtual clock and records the
+        path, so a whole dance can be simulated in a few milliseconds
+    """
+
+    def __init__(self, clock=None, default_velocity=0.2, default_rate=360.0 / 5):
+        self.clock = clock if clock is not None else VirtualClock()
+        self.default_velocity = default_velocity
+        self.default_rate = default_rate
+        self.x = 0.0
+        self.y = 0.0
+        self.z = 0.0
+        self.heading = 0.0
+        self.distance = 0.0
+        self.max_velocity = 0.0
+        self.max_rate = 0.0
+        self.moves = 0
+
+    def _move(self, distance, velocity, angle_degrees):
+        if velocity is None or velocity <= 0:
+            velocity = self.default_velocity
+        heading = math.radians(self.heading + angle_degrees)
+        self.x += distance * math.cos(heading)
+        self.y += distance * math.sin(heading)
+        self.distance += abs(distance)
+        self.max_velocity = max(self.max_velocity, velocity)
+        self.moves += 1
+        self.clock.sleep(abs(distance) / velocity)
+
+    def _turn(self, angle_degrees, rate):
+        if rate is None or rate <= 0:
+            rate = self.default_rate
+        self.heading = (self.heading + angle_degrees) % 360
+        self.max_rate = max(self.max_rate, rate)
+        self.moves += 1
+        self.clock.sleep(abs(angle_degrees) / rate)
+
+    def forward(self, s, velocity=None):
+        self._move(s, velocity, 0)
+
+    def back(self, s, velocity=None):
+        self._move(s, velocity, 180)
+
+    def left(self, s, velocity=None):
+        self._move(s, velocity, 90)
+
+    def right(self, s, velocity=None):
+        self._move(s, velocity, -90)
+
+    def up(self, s, velocity=None):
+        self.z += s
+        self.clock.sleep(s / (velocity or self.default_velocity))
+
+    def down(self, s, velocity=None):
+        self.z = max(0.0, self.z - s)
+        self.clock.sleep(s / (velocity or self.default_velocity))
+
+    def turn_left(self, angle_degrees, rate=None):
+        self._turn(angle_degrees, rate)
+
+    def turn_right(self, angle_degrees, rate=None):
+        self._turn(-angle_degrees, rate)
+
+    def land(self, velocity=None):
+        self.down(self.z, velocity)
+
+    def displacement(self):
+        return math.hypot(self.x, self.y)
@@ -0,0 +1,115 @@
+import time
+import logging
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+# Registries of motion, audio and beat backends.  Every backend imports its
+# libraries only when it is used, so a simulated dance never loads cflib,
+# pyaudio or aubio.
+MOTION = {}
+AUDIO = {}
+BEAT = {}
+
+
+def register(registry, name):
+    def decorator(f):
+        registry[name] = f
+        return f
+    return decorator
+
+
+@register(MOTION, 'cflib')
+@contextmanager
+def cflib_motion(args):
+    """
+        Fly a real Crazyflie: connect, take off and land when done.
+    """
+    import cflib.crtp
+    from cflib.crazyflie import Crazyflie
+    from cflib.crazyflie.syncCrazyflie import SyncCrazyflie
+    from cflib.positioning.motion_commander import MotionCommander
+
+    cflib.crtp.init_drivers(enable_debug_driver=True)
+    with SyncCrazyflie(args.uri, cf=Crazyflie(rw_cache='./cache')) as scf:
+        with MotionCommander(scf) as mc:
+            mc.up(0.5, velocity=0.3)
+            time.sleep(3)
+            yield mc
+            mc.land(0.3)
+
+
+@register(MOTION, 'mock')
+@contextmanager
+def mock_motion(args):
+    """
+        Print the moves instead of flying them.
+    """
+    from MC import MC
+    yield MC
+
+
+@register(MOTION, 'sim')
+@contextmanager
+def sim_motion(args):
+    """
+        Fly on a virtual clock and report the path when done.
+    """
+    from MC import VirtualMC
+    mc = VirtualMC()
+    yield mc
+    log.info("Simulated " + str(mc.moves) + " moves, distance: " + str(mc.distance) + ", displacement: " + str(mc.displacement()))
+
+
+@register(BEAT, 'aubio')
+def aubio_beats(args):
+    """
+        Detect beats from the track while it plays.
+    """
+    return None
+
+
+@register(BEAT, 'precomputed')
+def precomputed_beats(args):
+    """
+        Beat times from --beats-file, or a steady --bpm.
+    """
+    import music
+    if args.beats_file:
+        return music.load_beats(args.beats_file)
+    if args.bpm:
+        return music.tempo_beats(args.bpm, args.count)
+    raise ValueError("precomputed beats need --beats-file or --bpm")
+
+
+@register(AUDIO, 'pyaudio')
+def pyaudio_audio(args, handle_beat, beats):
+    """
+        Play the track through the sound card.
+    """
+    import music
+    music.play(args.track, handle_beat, 0, beats)
+
+
+@register(AUDIO, 'file')
+def file_audio(args, handle_beat, beats):
+    """
+        Read the track in real time without playing it.
+    """
+    import music
+    music.play_silent(args.track, handle_beat, 0, beats)
+
+
+@register(AUDIO, 'none')
+def no_audio(args, handle_beat, beats):
+    """
+        No track: follow the precomputed beats only.
+    """
+    import music
+    if beats is None:
+        raise ValueError("audio backend 'none' needs precomputed beats")
+    music.play_beats(beats, handle_beat)
+
+
+def play(args, handle_beat):
+    AUDIO[args.audio](args, handle_beat, BEAT[args.beat](args))
@@ -1,57 +1,56 @@
-import os
-import threading
 import time
+START = time.time()  # before the imports, so startup time includes them
+
 import logging
+import argparse
 import tango
-import music
-from MC import MC
+import hotswap
+import backends
 
-import cflib.crtp
-from cflib.crazyflie import Crazyflie
-from cflib.crazyflie.syncCrazyflie import SyncCrazyflie
-from cflib.positioning.motion_commander import MotionCommander
+ROUTINES = {
+    'pattern': lambda m, mc, a: m.pattern(mc, a.step_size, a.velocity, announce=True),
+    'dance_tango': lambda m, mc, a: m.dance_tango("Tango", mc, a.step_size, a.velocity, announce=False),
+    'lazy_tango': lambda m, mc, a: m.lazy_tango("Tango", mc, a.step_size, a.velocity, announce=False),
+    'endless_tango': lambda m, mc, a: m.endless_tango("Tango", mc, a.step_size, a.velocity, announce=False),
+    'turn_full_left': lambda m, mc, a: m.TurnFullLeft("TurnFullLeft", mc, a.step_size, a.velocity, announce=True),
+}
 
 
 def handle_beat(flight_time):
-    nt = dance.next_task()
+    nt = dance.next_task(flight_time)
     if nt is not None:
-        if isinstance(nt, tango.Step):
-            length = nt.get_step_size()
-            nt.set_velocity(float(length) / (float(flight_time * 3) / 2))
-        if isinstance(nt, tango.Wait):
-            nt.set_interval(flight_time)
-        if isinstance(nt, tango.Turn):
-            angle_degrees = nt.get_angle()
-            rate = float(angle_degrees) / (float(flight_time * 3) / 2)
-            nt.set_rate(rate)
-        nt.run()
+        tango.fit_to_beat(nt, flight_time)
+        tango.run_until_done(nt)
     else:
         print("beat length: ", flight_time)
 
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Dance tango with a Crazyflie")
+    parser.add_argument('--motion', choices=sorted(backends.MOTION), default='cflib')
+    parser.add_argument('--audio', choices=sorted(backends.AUDIO), default='pyaudio')
+    parser.add_argument('--beat', choices=sorted(backends.BEAT), default='aubio')
+    parser.add_argument('--routine', choices=sorted(ROUTINES), default='pattern')
+    parser.add_argument('--track', default="music/LaCumparsita.mp3")
+    parser.add_argument('--beats-file', default=None, help="precomputed beat times, one per line")
+    parser.add_argument('--bpm', type=float, default=None, help="steady tempo for precomputed beats")
+    parser.add_argument('--count', type=int, default=64, help="number of beats at --bpm")
+    parser.add_argument('--step-size', type=float, default=0.15)
+    parser.add_argument('--velocity', type=float, default=0.9)
+    parser.add_argument('--uri', default='radio://0/80/2M')
+    args = parser.parse_args(argv)
+    if args.beat == 'aubio' and args.audio == 'none':
+        parser.error("--beat aubio detects beats in the track and needs --audio pyaudio or file")
+    return args
+
+
 if __name__ == '__main__':
-    #URI = 'radio://0/80/250K'
-    URI = 'radio://0/80/2M'
+    args = parse_args()
     logging.basicConfig(filename='example.log', level=logging.DEBUG)
     log = logging.getLogger(__name__)
 
-    cflib.crtp.init_drivers(enable_debug_driver=True)
-
-    simulate = 0
-
-    if simulate:
-        dance = tango.pattern(MC, 0.15, 0.9, announce=True)
-        dance = tango.pattern(MC, 0.5, 0.9, announce=True)
-        music.play("music/LaCumparsita.mp3", handle_beat, 0)
-    else:
-        with SyncCrazyflie(URI, cf=Crazyflie(rw_cache='./cache')) as scf:
-            with MotionCommander(scf) as mc:
-                mc.up(0.5, velocity=0.3)
-                time.sleep(3)
-                dance = tango.pattern(mc, 0.15, 0.9, announce=True)
-                # dance = TurnFullLeft("TurnFullLeft", mc, 0.5, 0.5, announce=True)
-                # dance = tango.dance_tango("Tango", mc, 0.3, 0.9, announce=False)
-                t = threading.Thread(target=music.play, args=("music/LaCumparsita.mp3", handle_beat, 0))
-                t.start()
-                t.join()
-                mc.land(0.3)
+    with backends.MOTION[args.motion](args) as mc:
+        dance = hotswap.HotSwap(tango, lambda m: ROUTINES[args.routine](m, mc, args))
+        dance.watch()
+        log.info("Ready to dance in " + str(time.time() - START) + "s")
+        backends.play(args, handle_beat)
@@ -0,0 +1,223 @@
+import os
+import time
+import logging
+import importlib
+import threading
+from enum import Enum
+from functools import partial
+
+from tasks import LazySequence
+
+log = logging.getLogger(__name__)
+
+# Attributes that hold run-time state rather than choreography, so they
+# are ignored when comparing two trees.
+RUNTIME_ATTRS = ('status', 'head', 'size', 'children', 'loop_count', 'shuffled', 'mc',
+                 'current', '_source', '_touched', '_touched_ids',
+                 '_timer', '_generation', '_expired', '_event', '_call', 'attempt',
+                 '_signature', '_resume', 'position', '_moves', '_moves_lock')
+
+
+def value_key(v):
+    """
+        Turn an attribute value into something hashable and comparable
+        across module reloads.
+    """
+    if v is None or isinstance(v, (bool, int, float, str)):
+        return v
+    if isinstance(v, Enum):
+        return type(v).__name__, v.name
+    if isinstance(v, (list, tuple)):
+        return tuple(value_key(i) for i in v)
+    if isinstance(v, dict):
+        return tuple(sorted((k, value_key(i)) for k, i in v.items()))
+    if isinstance(v, partial):
+        return value_key(v.func), value_key(v.args), value_key(v.keywords)
+    code = getattr(v, '__code__', None)
+    if code is not None:
+        cells = tuple(value_key(c.cell_contents) for c in v.__closure__ or ())
+        return v.__qualname__, code.co_code, value_key(code.co_consts), cells
+    if hasattr(v, 'co_code'):
+        return v.co_name, v.co_code
+    return type(v).__name__
+
+
+def signature(task):
+    """
+        Content hash of a (sub)tree: the task type, its parameters and the
+        signatures of its children.  Two subtrees with the same signature
+        dance the same figure.  The signature is stored on the node the
+        first time it is asked for, which HotSwap does right after a tree
+        is built, because dancing rewrites parameters such as velocity.
+    """
+    sig = vars(task).get('_signature')
+    if sig is None:
+        attrs = tuple(sorted((k, value_key(v)) for k, v in vars(task).items() if k not in RUNTIME_ATTRS))
+        children = tuple(signature(c) for c in task.children)
+        sig = (type(task).__name__, attrs, children)
+        task._signature = sig
+    return sig
+
+
+def index_tree(tree):
+    """
+        Map every signature in the tree to the first node that has it.
+    """
+    index = {}
+    stack = [tree]
+    while stack:
+        t = stack.pop()
+        index.setdefault(signature(t), t)
+        stack.extend(t.children)
+    return index
+
+
+def upgrade(old, new):
+    """
+        Point an unchanged old subtree at the classes and enum members of
+        the freshly loaded module, so isinstance checks and comparisons
+        like direction == Direction.FORWARD keep working after a reload.
+    """
+    if type(old) is not type(new):
+        old.__class__ = type(new)
+    for k, v in vars(new).items():
+        if isinstance(v, Enum):
+            setattr(old, k, v)
+    for o, n in zip(old.children, new.children):
+        upgrade(o, n)
+
+
+def graft(new, index, stats):
+    """
+        Replace every subtree of new that also exists in the old tree with
+        the old node, keeping its state.  Only changed subtrees stay new.
+    """
+    old = index.get(signature(new))
+    if old is not None:
+        upgrade(old, new)
+        stats['reused'] += 1
+        return old
+    stats['rebuilt'] += 1
+    for i, c in enumerate(new.children):
+        new.children[i] = graft(c, index, stats)
+        if new.children[i] is not c:
+            # a reused subtree may carry state, so the new parent must reset it
+            new.touch(new.children[i])
+    return new
+
+
+def diff(old, new):
+    """
+        Structural diff of two trees.  Returns the merged tree and a dict
+        with the number of reused and rebuilt nodes.
+    """
+    stats = {'reused': 0, 'rebuilt': 0}
+    signature(new)
+    merged = graft(new, index_tree(old), stats)
+    return merged, stats
+
+
+def carry_position(old, new):
+    """
+        Move the head of new to the figure following the one the old tree
+        danced last, falling back to the same index.  A lazy sequence
+        skips ahead to the same figure number instead.
+    """
+    if new is old:
+        return
+    if isinstance(old, LazySequence) and isinstance(new, LazySequence):
+        new.seek(old.position)
+        return
+    if new.size == 0:
+        return
+    if old.size == 0:
+        new.head = 0
+        return
+    last = (old.head - 1) % old.size
+    candidates = [i for i, c in enumerate(new.children) if c is old.children[last]]
+    if candidates:
+        new.head = (min(candidates, key=lambda i: abs(i - last)) + 1) % new.size
+    else:
+        new.head = min(old.head, new.size) % new.size
+
+
+class HotSwap(object):
+    """
+        Live-reload wrapper around a dance.  build(module) returns the tree;
+        when the module's source changes it is reloaded and rebuilt in the
+        watcher thread, and the merged tree replaces the running one at the
+        next beat.
+    """
+
+    def __init__(self, module, build, poll_interval=0.5):
+        self.module = module
+        self.build = build
+        self.poll_interval = poll_interval
+        self.tree = build(module)
+        signature(self.tree)
+        self.beat_interval = None
+        self._pending = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._mtime = os.path.getmtime(module.__file__)
+
+    def __getattr__(self, item):
+        if item == 'tree':
+            raise AttributeError(item)
+        return getattr(self.tree, item)
+
+    def next_task(self, beat_interval=None):
+        if beat_interval is not None:
+            self.beat_interval = beat_interval
+        self.swap()
+        return self.tree.next_task()
+
+    def swap(self):
+        with self._lock:
+            new = self._pending
+            self._pending = None
+            if new is not None and new is not self.tree:
+                carry_position(self.tree, new)
+                self.tree = new
+                log.info("Swapped in new choreography " + str(new))
+
+    def reload(self):
+        start = time.time()
+        importlib.reload(self.module)
+        merged, stats = diff(self.tree, self.build(self.module))
+        if merged is not self.tree and isinstance(merged, LazySequence) and isinstance(self.tree, LazySequence):
+            # skip ahead here rather than on the beat; swap only catches up
+            # the few figures danced since
+            merged.seek(self.tree.position)
+        with self._lock:
+            self._pending = merged
+        elapsed = time.time() - start
+        log.info("Reloaded " + self.module.__name__ + " in " + str(elapsed) + "s, reused: " + str(stats['reused']) + ", rebuilt: " + str(stats['rebuilt']))
+        if self.beat_interval is not None and elapsed > self.beat_interval:
+            log.warning("Reload took longer than a beat (" + str(self.beat_interval) + "s)")
+        return stats
+
+    def poll(self):
+        mtime = os.path.getmtime(self.module.__file__)
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            self.reload()
+        except Exception as e:
+            # keep dancing the current routine while the file is being edited
+            log.error(e)
+        return True
+
+    def watch(self):
+        t = threading.Thread(target=self._watch)
+        t.daemon = True
+        t.start()
+        return t
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            self.poll()
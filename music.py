@@ -1,26 +1,73 @@
-import pyaudio
-import aubio
 import time
 import threading
-import numpy as np
 
-def play(file_name, handle_beat, sample_rate=0):
+
+def load_beats(file_name):
+    """
+        Read precomputed beat times, one number of seconds per line.
+        Blank lines and lines starting with # are skipped.
+    """
+    beats = []
+    with open(file_name) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                beats.append(float(line))
+    return beats
+
+
+def tempo_beats(bpm, count):
+    """
+        Beat times of a steady tempo
+    """
+    interval = 60.0 / bpm
+    return [interval * (i + 1) for i in range(count)]
+
+
+class BeatClock(object):
+    """
+        Turn a position in the track into beats: either detected by aubio
+        from the samples or looked up in a list of precomputed beat times.
+    """
+
+    def __init__(self, win_s, hop_s, sample_rate, beats=None):
+        self.beats = beats
+        self.next_beat = 0
+        if beats is None:
+            import aubio
+            self.a_tempo = aubio.tempo("default", win_s, hop_s, sample_rate)
+
+    def __call__(self, samples, position):
+        if self.beats is None:
+            return self.a_tempo(samples)
+        if self.next_beat < len(self.beats) and position >= self.beats[self.next_beat]:
+            self.next_beat += 1
+            return True
+        return False
+
+
+def play(file_name, handle_beat, sample_rate=0, beats=None):
+    import pyaudio
+    import aubio
+
     win_s = 1024  # fft size
     hop_s = win_s // 2  # hop size
     a_source = aubio.source(file_name, sample_rate, hop_s)  # create aubio source
 
     sample_rate = a_source.samplerate
 
-    # create aubio tempo detection
-    a_tempo = aubio.tempo("default", win_s, hop_s, sample_rate)
+    # create aubio tempo detection, or follow the precomputed beats
+    is_beat_at = BeatClock(win_s, hop_s, sample_rate, beats)
     global last_beat_time
     last_beat_time = time.time()
+    position = [0.0]
 
 
     # pyaudio callback
     def callback(_in_data, _frame_count, _time_info, _status):
         samples, read = a_source()
-        is_beat = a_tempo(samples)
+        position[0] += float(read) / sample_rate
+        is_beat = is_beat_at(samples, position[0])
         global last_beat_time
         now = time.time()
         if is_beat:
@@ -60,3 +107,60 @@ def play(file_name, handle_beat, sample_rate=0):
 
     # close pyaudio
     p.terminate()
+
+
+def play_silent(file_name, handle_beat, sample_rate=0, beats=None):
+    """
+        Read the track in real time without a sound device, e.g. on a
+        headless machine, and dispatch its beats like play does.
+    """
+    import aubio
+
+    win_s = 1024  # fft size
+    hop_s = win_s // 2  # hop size
+    a_source = aubio.source(file_name, sample_rate, hop_s)
+
+    sample_rate = a_source.samplerate
+    is_beat_at = BeatClock(win_s, hop_s, sample_rate, beats)
+    start = last_beat_time = time.time()
+    position = 0.0
+
+    while True:
+        samples, read = a_source()
+        position += float(read) / sample_rate
+        is_beat = is_beat_at(samples, position)
+        delay = start + position - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        now = time.time()
+        if is_beat:
+            beat_length = now - last_beat_time
+            last_beat_time = now
+            print("tick")
+            t = threading.Thread(target=handle_beat, args=[beat_length])
+            t.start()
+        if read < hop_s:
+            handle_beat(now - last_beat_time)
+            break
+
+
+def play_beats(beats, handle_beat):
+    """
+        No music at all: fire handle_beat at the precomputed beat times.
+        The last beat runs inline, like the end of the track in play, so
+        its move is finished when this returns.
+    """
+    start = last_beat_time = time.time()
+    for i, beat in enumerate(beats):
+        delay = start + beat - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        now = time.time()
+        beat_length = now - last_beat_time
+        last_beat_time = now
+        print("tick")
+        if i == len(beats) - 1:
+            handle_beat(beat_length)
+        else:
+            t = threading.Thread(target=handle_beat, args=[beat_length])
+            t.start()
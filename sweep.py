@@ -0,0 +1,161 @@
+import os
+import csv
+import sys
+import time
+import logging
+import argparse
+import itertools
+from random import Random
+from concurrent.futures import ProcessPoolExecutor
+
+import tango
+from MC import VirtualClock, VirtualMC
+
+log = logging.getLogger(__name__)
+
+FIELDS = ['routine', 'step_size', 'velocity', 'beat_factor', 'tempo', 'beats',
+          'total_displacement', 'net_displacement', 'max_velocity', 'max_rate',
+          'mean_timing_error', 'max_timing_error', 'duration', 'timing_errors']
+
+
+def build_pattern(mc, step_size, velocity, **kwargs):
+    # every move is a top-level figure, so fit_to_beat sets its velocity on
+    # every beat and the velocity given here is never danced
+    return tango.pattern(mc, step_size, **kwargs)
+
+
+def build_dance_tango(mc, step_size, velocity, **kwargs):
+    return tango.dance_tango("Tango", mc, step_size, velocity, **kwargs)
+
+
+ROUTINES = {
+    'pattern': build_pattern,
+    'dance_tango': build_dance_tango,
+}
+
+# Routines whose velocity is set entirely by fit_to_beat; the velocity axis
+# is left out of their sweep and the table.
+BEAT_FITTED = ('pattern',)
+
+
+def simulate(params):
+    """
+        Dance one routine on a virtual clock, with a beat every 60 / tempo
+        seconds (plus jitter), the way dance.handle_beat would: every beat
+        starts its figure on its own thread, on the beat, even if the
+        previous figure is still moving.  Like handle_beat, a figure is
+        fitted to the length of the beat that just ended; its timing error
+        is how far it ends from the next beat actually drawn, positive when
+        it runs over.
+    """
+    clock = VirtualClock()
+    mc = VirtualMC(clock)
+    # moves and waits run inline on the virtual clock
+    dance = ROUTINES[params['routine']](mc, params['step_size'], params['velocity'],
+                                        blocking=True, sleep=clock.sleep, timeout=None)
+    rnd = Random(params.get('seed'))
+    interval = 60.0 / params['tempo']
+    jitter = params.get('jitter', 0.0)
+
+    intervals = [interval * (1 + rnd.uniform(-jitter, jitter)) for _ in range(params['beats'] + 1)]
+    beat_time = intervals[0]
+    end = 0.0
+    errors = []
+    for flight_time, next_interval in zip(intervals, intervals[1:]):
+        clock.now = beat_time
+        nt = dance.next_task()
+        if nt is not None:
+            tango.fit_to_beat(nt, flight_time, params['beat_factor'])
+            nt.run()
+        beat_time += next_interval
+        errors.append(clock.now - beat_time)
+        end = max(end, clock.now)
+
+    result = dict((k, params[k]) for k in FIELDS[:6])
+    result.update(total_displacement=mc.distance,
+                  net_displacement=mc.displacement(),
+                  max_velocity=mc.max_velocity,
+                  max_rate=mc.max_rate,
+                  mean_timing_error=sum(abs(e) for e in errors) / len(errors) if errors else 0.0,
+                  max_timing_error=max(abs(e) for e in errors) if errors else 0.0,
+                  duration=end,
+                  timing_errors=' '.join('%.4f' % e for e in errors))
+    return result
+
+
+def grid(routine, step_sizes, velocities, beat_factors, tempos, beats, **kwargs):
+    if routine in BEAT_FITTED:
+        velocities = [None]
+    for s, v, f, t in itertools.product(step_sizes, velocities, beat_factors, tempos):
+        yield dict(routine=routine, step_size=s, velocity=v, beat_factor=f, tempo=t, beats=beats, **kwargs)
+
+
+def random_search(n, routine, step_sizes, velocities, beat_factors, tempos, beats, seed=None, **kwargs):
+    """
+        Draw n points uniformly from the ranges spanned by each list.
+    """
+    rnd = Random(seed)
+    for _ in range(n):
+        yield dict(routine=routine,
+                   step_size=rnd.uniform(min(step_sizes), max(step_sizes)),
+                   velocity=None if routine in BEAT_FITTED else rnd.uniform(min(velocities), max(velocities)),
+                   beat_factor=rnd.uniform(min(beat_factors), max(beat_factors)),
+                   tempo=rnd.uniform(min(tempos), max(tempos)),
+                   beats=beats, seed=seed, **kwargs)
+
+
+def run(points, workers=None):
+    """
+        Simulate every point in a process pool, one dance per task.
+    """
+    points = list(points)
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(points) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(simulate, points, chunksize=chunksize))
+
+
+def write_table(results, out):
+    writer = csv.DictWriter(out, fieldnames=FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    for r in results:
+        writer.writerow(r)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep choreography parameters on simulated dances")
+    parser.add_argument('--routine', choices=sorted(ROUTINES), default='pattern')
+    parser.add_argument('--step-size', type=float, nargs='+', default=[0.1, 0.15, 0.2, 0.3, 0.5])
+    parser.add_argument('--velocity', type=float, nargs='+', default=[0.5, 0.9, 1.2],
+                        help="ignored for " + ", ".join(BEAT_FITTED) + ", where the beat sets every velocity")
+    parser.add_argument('--beat-factor', type=float, nargs='+', default=[1.0, 1.25, 1.5])
+    parser.add_argument('--tempo', type=float, nargs='+', default=[60, 90, 120, 150], help="beats per minute")
+    parser.add_argument('--beats', type=int, default=128, help="beats per dance")
+    parser.add_argument('--jitter', type=float, default=0.0, help="relative beat length jitter")
+    parser.add_argument('--random', type=int, default=0, metavar='N',
+                        help="draw N random points from the given ranges instead of the full grid")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--out', default=None, help="CSV file, stdout by default")
+    args = parser.parse_args(argv)
+
+    space = (args.routine, args.step_size, args.velocity, args.beat_factor, args.tempo, args.beats)
+    if args.random:
+        points = random_search(args.random, *space, seed=args.seed, jitter=args.jitter)
+    else:
+        points = grid(*space, seed=args.seed, jitter=args.jitter)
+
+    start = time.time()
+    results = run(points, args.workers)
+    log.info("Simulated " + str(len(results)) + " dances in " + str(time.time() - start) + "s")
+
+    if args.out:
+        with open(args.out, 'w', newline='') as f:
+            write_table(results, f)
+    else:
+        write_table(results, sys.stdout)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
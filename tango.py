@@ -1,7 +1,18 @@
+import threading
 from enum import Enum
+from random import Random
+from functools import partial
 from tasks import *
 
 
+# A move lasts this many beats, which keeps the drone gliding between beats.
+BEAT_FACTOR = 1.5
+
+# A motion commander call that has not returned after this many seconds is
+# abandoned and the move fails.
+MOVE_TIMEOUT = 10.0
+
+
 class Direction(Enum):
     BACK = 0
     FORWARD = 1
@@ -9,13 +20,97 @@ class Direction(Enum):
     RIGHT = 3
 
 
-class Step(Task):
+def fit_to_beat(task, flight_time, beat_factor=BEAT_FACTOR):
+    """
+        Stretch a step, turn or wait so that it lasts beat_factor beats
+        of flight_time seconds.
+    """
+    if isinstance(task, Step):
+        length = task.get_step_size()
+        task.set_velocity(float(length) / (float(flight_time) * beat_factor))
+    if isinstance(task, Wait):
+        task.set_interval(flight_time)
+    if isinstance(task, Turn):
+        angle_degrees = task.get_angle()
+        rate = float(angle_degrees) / (float(flight_time) * beat_factor)
+        task.set_rate(rate)
+
+
+class MotionTask(Task):
+    """
+        Base class for tasks that call the motion commander.  The call runs
+        under a Timeout of timeout=... seconds (MOVE_TIMEOUT by default), so
+        a stuck motion commander fails the move instead of hanging the show.
+        timeout=None calls the motion commander inline.
+
+        Figures reuse one Step for several beats, and a move can still be
+        running when the next beat's thread starts the same Step, so every
+        calling thread gets its own Timeout.
+    """
+
+    def __init__(self, name, mc, *args, **kwargs):
+        super(MotionTask, self).__init__(name, *args, **kwargs)
+        self.mc = mc
+        self.timeout = kwargs.get('timeout', MOVE_TIMEOUT)
+        self.blocking = kwargs.get('blocking', False)
+        self.wheel = kwargs.get('wheel')
+        self._moves = {}
+        self._moves_lock = threading.Lock()
+
+    def call_mc(self):
+        pass
+
+    def move(self):
+        try:
+            self.call_mc()
+            return True
+        except Exception as e:
+            log.error(e)
+            return False
+
+    def run(self):
+        if self.timeout is None:
+            if self._announce:
+                self.announce()
+            log.debug(self.describe())
+            return TaskStatus.SUCCESS if self.move() else TaskStatus.FAILURE
+
+        caller = threading.current_thread().ident
+        with self._moves_lock:
+            timeout = self._moves.get(caller)
+            if timeout is None:
+                timeout = Timeout(self.name, self.timeout, children=[CallbackTask(self.name, cb=self.move)],
+                                  blocking=self.blocking, wheel=self.wheel)
+                self._moves[caller] = timeout
+        if timeout.status is None:
+            if self._announce:
+                self.announce()
+            log.debug(self.describe())
+        timeout.status = timeout.run()
+        if timeout.status != TaskStatus.RUNNING:
+            with self._moves_lock:
+                if self._moves.get(caller) is timeout:
+                    del self._moves[caller]
+        return timeout.status
+
+    def reset(self):
+        with self._moves_lock:
+            moves = list(self._moves.values())
+            self._moves.clear()
+        for timeout in moves:
+            timeout.reset()
+        super(MotionTask, self).reset()
+
+    def describe(self):
+        return "task_name: " + self.name
+
+
+class Step(MotionTask):
     def __init__(self, name, mc, step_size, velocity, direction, *args, **kwargs):
-        super(Step, self).__init__(name, *args, **kwargs)
+        super(Step, self).__init__(name, mc, *args, **kwargs)
         self.step_size = step_size
         self.velocity = velocity
         self.direction = direction
-        self.mc = mc
 
     def set_step_size(self, ss):
         self.step_size = ss
@@ -29,32 +124,26 @@ class Step(Task):
     def set_direction(self, d):
         self.direction = d
 
-    def run(self):
-        if self._announce:
-            self.announce()
-        log.debug("task_name: " + self.name + ", step_size: " + str(self.step_size) + ", velocity: " + str(self.velocity) + ", direction: " + str(self.direction))
-        try:
-            if self.direction == Direction.BACK:
-                self.mc.back(self.step_size, velocity=self.velocity)
-            elif self.direction == Direction.FORWARD:
-                self.mc.forward(self.step_size, velocity=self.velocity)
-            elif self.direction == Direction.LEFT:
-                self.mc.left(self.step_size, velocity=self.velocity)
-            elif self.direction == Direction.RIGHT:
-                self.mc.right(self.step_size, velocity=self.velocity)
-            return TaskStatus.SUCCESS
-        except Exception as e:
-            log.error(e)
-            return TaskStatus.FAILURE
+    def describe(self):
+        return "task_name: " + self.name + ", step_size: " + str(self.step_size) + ", velocity: " + str(self.velocity) + ", direction: " + str(self.direction)
+
+    def call_mc(self):
+        if self.direction == Direction.BACK:
+            self.mc.back(self.step_size, velocity=self.velocity)
+        elif self.direction == Direction.FORWARD:
+            self.mc.forward(self.step_size, velocity=self.velocity)
+        elif self.direction == Direction.LEFT:
+            self.mc.left(self.step_size, velocity=self.velocity)
+        elif self.direction == Direction.RIGHT:
+            self.mc.right(self.step_size, velocity=self.velocity)
 
 
-class Turn(Task):
+class Turn(MotionTask):
     def __init__(self, name, mc, angle_degrees, rate, direction, *args, **kwargs):
-        super(Turn, self).__init__(name, *args, **kwargs)
+        super(Turn, self).__init__(name, mc, *args, **kwargs)
         self.angle_degrees = angle_degrees
         self.rate = rate
         self.direction = direction
-        self.mc = mc
 
     def set_rate(self, r):
         self.rate = r
@@ -65,19 +154,14 @@ class Turn(Task):
     def get_angle(self):
         return self.angle_degrees
 
-    def run(self):
-        if self._announce:
-            self.announce()
-        log.debug("task_name: " + self.name + ", angle_degrees: " + str(self.angle_degrees) + ", rate: " + str(self.rate) + ", direction: " + str(self.direction))
-        try:
-            if self.direction == Direction.LEFT:
-                self.mc.turn_left(self.angle_degrees, self.rate)
-            elif self.direction == Direction.RIGHT:
-                self.mc.turn_right(self.angle_degrees, self.rate)
-            return TaskStatus.SUCCESS
-        except Exception as e:
-            log.error(e)
-            return TaskStatus.FAILURE
+    def describe(self):
+        return "task_name: " + self.name + ", angle_degrees: " + str(self.angle_degrees) + ", rate: " + str(self.rate) + ", direction: " + str(self.direction)
+
+    def call_mc(self):
+        if self.direction == Direction.LEFT:
+            self.mc.turn_left(self.angle_degrees, self.rate)
+        elif self.direction == Direction.RIGHT:
+            self.mc.turn_right(self.angle_degrees, self.rate)
 
 
 class Land(Task):
@@ -186,42 +270,68 @@ class TurnFullLeft(Sequence):
         self.add_child(turn_left)
 
 
+def tango_figures(mc, step_size, velocity, *args, **kwargs):
+    """
+        The figures of dance_tango, created one at a time on demand.
+    """
+    def forward():
+        return Step("forward", mc, step_size, velocity, Direction.FORWARD, *args, **kwargs)
+
+    def turn_half_left():
+        return Turn("Turn Left", mc, 45, 360, Direction.LEFT, *args, **kwargs)
+
+    yield BoxStep("BoxStep", mc, step_size, velocity, *args, **kwargs)
+    yield forward()
+    yield forward()
+    yield Wait("Skip Beat", float(step_size / velocity), *args, **kwargs)  # beat_time = step_size / velocity
+    yield OchoCortadoLinear("OchoCortadoLinear", mc, step_size, velocity, *args, **kwargs)
+    yield forward()
+    yield EightSteps("EightSteps", mc, step_size, velocity, *args, **kwargs)
+    yield forward()
+    yield OchoCortadoLinear("OchoCortadoLinear", mc, step_size, velocity, *args, **kwargs)
+    yield turn_half_left()
+    yield forward()
+    yield OchoCortado("OchoCortado", mc, step_size, velocity, *args, **kwargs)
+    yield Turn("Turn Left", mc, 90, 360, Direction.LEFT, *args, **kwargs)
+    yield forward()
+    yield OchoCortado("OchoCortado", mc, step_size, velocity, *args, **kwargs)
+    yield turn_half_left()
+    yield turn_half_left()
+    yield turn_half_left()
+    yield forward()
+
+
+def improvise(mc, step_size, velocity, *args, **kwargs):
+    """
+        An endless, procedurally generated tango: every figure is picked at
+        random.  Pass seed=... to repeat the same dance.
+    """
+    rnd = Random(kwargs.pop('seed', None))
+    figures = [BoxStep, EightSteps, OchoCortado, OchoCortadoLinear, TurnFullLeft]
+    while True:
+        if rnd.random() < 0.3:
+            yield Step("forward", mc, step_size, velocity, Direction.FORWARD, *args, **kwargs)
+        else:
+            figure = rnd.choice(figures)
+            yield figure(figure.__name__, mc, step_size, velocity, *args, **kwargs)
+
+
 def dance_tango(name, mc, step_size, velocity, *args, **kwargs):
     behave = Sequence(name)
-    forward = Step("forward", mc, step_size, velocity, Direction.FORWARD, *args, **kwargs)
-    skip_beat = Wait("Skip Beat", float(step_size / velocity), *args, **kwargs)  # beat_time = step_size / velocity
-    turn_right = Turn("Turn Right", mc, 90, 360, Direction.RIGHT, *args, **kwargs)
-    turn_left = Turn("Turn Left", mc, 90, 360, Direction.LEFT, *args, **kwargs)
-    turn_half_right = Turn("Turn Right", mc, 45, 360, Direction.RIGHT, *args, **kwargs)
-    turn_half_left = Turn("Turn Left", mc, 45, 360, Direction.LEFT, *args, **kwargs)
-    box = BoxStep("BoxStep", mc, step_size, velocity, *args, **kwargs)
-    ocho_cordato = OchoCortado("OchoCortado", mc, step_size, velocity, *args, **kwargs)
-    ocho_cordato_linear = OchoCortadoLinear("OchoCortadoLinear", mc, step_size, velocity, *args, **kwargs)
-    eight_steps = EightSteps("EightSteps", mc, step_size, velocity, *args, **kwargs)
-
-    behave.add_child(box)
-    behave.add_child(forward)
-    behave.add_child(forward)
-    behave.add_child(skip_beat)
-    behave.add_child(ocho_cordato_linear)
-    behave.add_child(forward)
-    behave.add_child(eight_steps)
-    behave.add_child(forward)
-    behave.add_child(ocho_cordato_linear)
-    behave.add_child(turn_half_left)
-    behave.add_child(forward)
-    behave.add_child(ocho_cordato)
-    behave.add_child(turn_left)
-    behave.add_child(forward)
-    behave.add_child(ocho_cordato)
-    behave.add_child(turn_half_left)
-    behave.add_child(turn_half_left)
-    behave.add_child(turn_half_left)
-    behave.add_child(forward)
+    for figure in tango_figures(mc, step_size, velocity, *args, **kwargs):
+        behave.add_child(figure)
 
     return behave
 
 
+def lazy_tango(name, mc, step_size, velocity, *args, **kwargs):
+    return LazySequence(name, partial(tango_figures, mc, step_size, velocity, *args, **kwargs))
+
+
+def endless_tango(name, mc, step_size, velocity, *args, **kwargs):
+    return LazySequence(name, partial(improvise, mc, step_size, velocity, *args, **kwargs))
+
+
 def pattern(_mc, step_size=0.0, velocity=1.0, *args, **kwargs):
     forward = Step("forward", _mc, step_size, velocity, Direction.FORWARD, *args, **kwargs)
     backward = Step("backward", _mc, step_size, velocity, Direction.BACK, *args, **kwargs)
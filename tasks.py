@@ -1,7 +1,10 @@
 import time
 import logging
+import threading
 from random import shuffle
 
+import timers
+
 log = logging.getLogger(__name__)
 
 
@@ -26,6 +29,9 @@ class Task(object):
         self.children = children
         self.size = len(children)
         self.head = 0
+        self._resume = 0
+        self._touched = []
+        self._touched_ids = set()
 
     def __str__(self):
         return self.name
@@ -34,11 +40,39 @@ class Task(object):
         pass
 
     def reset(self):
-        for c in self.children:
+        """
+            Reset only the children that ran since the last reset; the rest
+            of the subtree is still clean, so a repeating figure costs as
+            much as the nodes it actually ran.
+        """
+        for c in self._touched:
             c.reset()
+        del self._touched[:]
+        self._touched_ids.clear()
+        self._resume = 0
 
         self.status = None
 
+    def reset_all(self):
+        """
+            Reset every descendant, e.g. after statuses were set by hand.
+        """
+        for c in self.children:
+            c.reset_all()
+        del self._touched[:]
+        self._touched_ids.clear()
+        self._resume = 0
+
+        self.status = None
+
+    def touch(self, c):
+        """
+            Remember that child c ran and needs a reset.
+        """
+        if id(c) not in self._touched_ids:
+            self._touched_ids.add(id(c))
+            self._touched.append(c)
+
     def add_child(self, c):
         self.children.append(c)
         self.size += 1
@@ -46,6 +80,9 @@ class Task(object):
     def remove_child(self, c):
         self.children.remove(c)
         self.size -= 1
+        if id(c) in self._touched_ids and c not in self.children:
+            self._touched_ids.remove(id(c))
+            self._touched.remove(c)
 
     def prepend_child(self, c):
         self.children.insert(0, c)
@@ -58,6 +95,7 @@ class Task(object):
     def get_next(self):
         item = self.children[self.head % self.size]  # circular queue behaviour
         self.head = (self.head + 1) % self.size
+        self.touch(item)  # handed out to be run
         return item
 
     def get_status(self):
@@ -91,10 +129,14 @@ class Iterator(Task):
         super(Iterator, self).__init__(name, *args, **kwargs)
 
     def run(self):
-        for c in self.children:
+        for i in range(self._resume, len(self.children)):
+            c = self.children[i]
             c.status = c.run()
+            self.touch(c)
             if c.status == TaskStatus.RUNNING:
+                self._resume = i
                 return c.status
+        self._resume = 0
         if self.reset_after:
             self.reset()
         return TaskStatus.SUCCESS
@@ -111,6 +153,7 @@ class Invert(Task):
     def run(self):
         for c in self.children:
             c.status = c.run()
+            self.touch(c)
             if c.status == TaskStatus.FAILURE:
                 return TaskStatus.SUCCESS
             elif c.status == TaskStatus.SUCCESS:
@@ -124,8 +167,8 @@ class Sequence(Task):
         A sequence runs each task in order until one fails,
         at which point it returns FAILURE. If all tasks succeed, a SUCCESS
         status is returned.  If a subtask is still RUNNING, then a RUNNING
-        status is returned and processing continues until either SUCCESS
-        or FAILURE is returned from the subtask.
+        status is returned and the next run resumes at that subtask until
+        either SUCCESS or FAILURE is returned from it.
     """
 
     def __init__(self, name, *args, **kwargs):
@@ -144,15 +187,22 @@ class Sequence(Task):
     def run(self):
         if self._announce:
             self.announce()
-        for c in self.children:
+        for i in range(self._resume, len(self.children)):
+            c = self.children[i]
             c.status = c.run()
+            self.touch(c)
             if c.status != TaskStatus.SUCCESS:
-                if c.status == TaskStatus.FAILURE:
-                    if self.reset_after:
-                        self.reset()
-                        return TaskStatus.FAILURE
+                if c.status == TaskStatus.RUNNING:
+                    # pick up at this child on the next run
+                    self._resume = i
+                    return c.status
+                self._resume = 0
+                if self.reset_after:
+                    self.reset()
+                    return TaskStatus.FAILURE
                 return c.status
 
+        self._resume = 0
         if self.reset_after:
             self.reset()
 
@@ -163,8 +213,8 @@ class Selector(Task):
     """ A selector runs each task in order until one succeeds,
         at which point it returns SUCCESS. If all tasks fail, a FAILURE
         status is returned.  If a subtask is still RUNNING, then a RUNNING
-        status is returned and processing continues until either SUCCESS
-        or FAILURE is returned from the subtask.
+        status is returned and the next run resumes at that subtask until
+        either SUCCESS or FAILURE is returned from it.
     """
 
     def __init__(self, name, *args, **kwargs):
@@ -173,16 +223,22 @@ class Selector(Task):
     def run(self):
         if self._announce:
             self.announce()
-        for c in self.children:
+        for i in range(self._resume, len(self.children)):
+            c = self.children[i]
             c.status = c.run()
+            self.touch(c)
             if c.status != TaskStatus.FAILURE:
                 if c.status == TaskStatus.SUCCESS:
+                    self._resume = 0
                     if self.reset_after:
                         self.reset()
                         return TaskStatus.SUCCESS
                     else:
                         return c.status
+                # pick up at this child on the next run
+                self._resume = i
                 return c.status
+        self._resume = 0
         if self.reset_after:
             self.reset()
         return TaskStatus.FAILURE
@@ -192,8 +248,8 @@ class RandomSelector(Task):
     """ A selector runs each task in order until one succeeds,
         at which point it returns SUCCESS. If all tasks fail, a FAILURE
         status is returned.  If a subtask is still RUNNING, then a RUNNING
-        status is returned and processing continues until either SUCCESS
-        or FAILURE is returned from the subtask.
+        status is returned and the next run resumes at that subtask until
+        either SUCCESS or FAILURE is returned from it.
     """
 
     def __init__(self, name, *args, **kwargs):
@@ -206,16 +262,22 @@ class RandomSelector(Task):
         if not self.shuffled:
             shuffle(self.children)
             self.shuffled = True
-        for c in self.children:
+        for i in range(self._resume, len(self.children)):
+            c = self.children[i]
             c.status = c.run()
+            self.touch(c)
             if c.status != TaskStatus.FAILURE:
                 if c.status == TaskStatus.SUCCESS:
+                    self._resume = 0
                     if self.reset_after:
                         self.reset()
                         return TaskStatus.SUCCESS
                     else:
                         return c.status
+                # pick up at this child on the next run
+                self._resume = i
                 return c.status
+        self._resume = 0
         if self.reset_after:
             self.reset()
         return TaskStatus.FAILURE
@@ -240,6 +302,7 @@ class Loop(Task):
         c = self.children[0]
         while self.iterations == -1 or self.loop_count < self.iterations:
             c.status = c.run()
+            self.touch(c)
             status = c.status
             self.status = status
             if status == TaskStatus.SUCCESS or status == TaskStatus.FAILURE:
@@ -250,27 +313,310 @@ class Loop(Task):
             return status
 
 
-class Wait(Task):
+class LazySequence(Task):
+    """
+        A sequence whose children are pulled one at a time from factory,
+        a callable returning an iterable (typically a generator function).
+        Each child is created just before it is needed and released once it
+        completes, so memory stays constant for arbitrarily long routines.
+        An endless generator makes run() dance forever; use get_next() to
+        step through it one figure per beat instead.
+    """
+
+    def __init__(self, name, factory, *args, **kwargs):
+        super(LazySequence, self).__init__(name, *args, **kwargs)
+        self.factory = factory
+        self.current = None
+        self.position = 0
+        self._source = None
+
+    def _pull(self):
+        if self._source is None:
+            self._source = iter(self.factory())
+            self.position = 0
+        self.current = next(self._source, None)
+        if self.current is not None:
+            self.position += 1
+        return self.current
+
+    def seek(self, position):
+        """
+            Skip ahead so the next figure pulled is number position + 1 of
+            the factory, creating and dropping the figures in between.
+            Seeking backwards starts the factory over.
+        """
+        if position < self.position:
+            self._source = None
+            self.position = 0
+        while self.position < position:
+            if self._pull() is None:
+                break
+        self.current = None
+
+    def get_next(self):
+        c = self._pull()
+        if c is None:
+            # start over like the circular queue of an eager sequence
+            self._source = None
+            c = self._pull()
+        self.current = None
+        return c
+
+    def next_task(self):
+        return self.get_next()
+
+    def run(self):
+        if self._announce:
+            self.announce()
+        while True:
+            c = self.current
+            if c is None:
+                c = self._pull()
+                if c is None:
+                    break
+            # lazily built children are dropped when done, so they are not
+            # touched; only self.current can need a reset
+            c.status = c.run()
+            if c.status != TaskStatus.SUCCESS:
+                if c.status == TaskStatus.FAILURE:
+                    self.current = None
+                    if self.reset_after:
+                        self.reset()
+                return c.status
+            self.current = None
+
+        if self.reset_after:
+            self.reset()
+
+        return TaskStatus.SUCCESS
+
+    def reset(self):
+        if self.current is not None:
+            self.current.reset()
+        self.current = None
+        self.position = 0
+        self._source = None
+        self.status = None
+
+
+class TimerTask(Task):
+    """
+        Base class for tasks that wait on the shared timer wheel instead of
+        sleeping: they return RUNNING while their timer is pending.  Pass
+        wheel=... to use another TimerWheel and blocking=True to hold the
+        calling thread until the task is done instead.
+    """
+
+    def __init__(self, name, *args, **kwargs):
+        super(TimerTask, self).__init__(name, *args, **kwargs)
+        self.wheel = kwargs.get('wheel')
+        self.blocking = kwargs.get('blocking', False)
+        self._timer = None
+        self._generation = 0
+        self._expired = False
+        self._event = threading.Event()
+
+    def _expire(self, generation):
+        # ignore a timer that fired while it was being replaced
+        if generation == self._generation:
+            self._expired = True
+            self._event.set()
+
+    def start_timer(self, delay):
+        self.cancel_timer()
+        self._generation += 1
+        self._expired = False
+        self._event.clear()
+        wheel = self.wheel if self.wheel is not None else timers.default_wheel()
+        self._timer = wheel.schedule(delay, self._expire, self._generation)
+
+    def cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def timer_pending(self):
+        return self._timer is not None and not self._expired
+
+    def reset(self):
+        self.cancel_timer()
+        super(TimerTask, self).reset()
+
+
+class Wait(TimerTask):
     """
-        This is a *blocking* wait task.  The interval argument is in seconds.
+        Wait for interval seconds on the timer wheel: RUNNING until the
+        interval is over, then SUCCESS.  With blocking=True this is a
+        *blocking* sleep instead; pass sleep=... to sleep on another
+        clock, e.g. a simulated one.
     """
 
     def __init__(self, name, interval, *args, **kwargs):
         super(Wait, self).__init__(name, *args, **kwargs)
         self._interval = interval
+        self._sleep = kwargs.get('sleep', time.sleep)
 
     def set_interval(self, interval):
         self._interval = interval
 
     def run(self):
+        if not self.blocking:
+            if self._timer is None:
+                if self._announce:
+                    self.announce()
+                self.start_timer(self._interval)
+            if self.timer_pending():
+                return TaskStatus.RUNNING
+            self._timer = None
+            return TaskStatus.SUCCESS
+
         if self._announce:
             self.announce()
         log.debug("task_name: " + self.name + ", wait interval: " + str(self._interval))
-        time.sleep(self._interval)
+        self._sleep(self._interval)
 
         return TaskStatus.SUCCESS
 
 
+class Timeout(TimerTask):
+    """
+        Fail if the child does not finish within timeout seconds.  The
+        child runs on a worker thread, so a call that hangs (e.g. a stuck
+        motion commander) is abandoned rather than stopping the show.
+    """
+
+    def __init__(self, name, timeout, *args, **kwargs):
+        super(Timeout, self).__init__(name, *args, **kwargs)
+        self.timeout = timeout
+        self._call = None
+
+    def _run_child(self, c, call):
+        try:
+            status = c.run()
+        except Exception as e:
+            log.error(e)
+            status = TaskStatus.FAILURE
+        call.append(status)
+        # an abandoned call finishing late must not wake the current one
+        if call is self._call:
+            self._event.set()
+
+    def _finish(self, status):
+        self.cancel_timer()
+        self._call = None
+        return status
+
+    def run(self):
+        if self._announce:
+            self.announce()
+        c = self.children[0]
+        if self._timer is None:
+            self.start_timer(self.timeout)
+        if self._call is None:
+            # every call gets its own daemon thread, so a hung call only
+            # ever holds its own thread
+            self._call = []
+            t = threading.Thread(target=self._run_child, args=(c, self._call))
+            t.daemon = True
+            t.start()
+            self.touch(c)
+        if self.blocking and not self._expired:
+            self._event.wait()
+
+        if self._call:
+            c.status = self._call[0]
+            self._call = None
+            if c.status != TaskStatus.RUNNING:
+                return self._finish(c.status)
+            self._event.clear()
+
+        if not self.timer_pending():
+            log.error(self.name + " timed out after " + str(self.timeout) + "s, abandoning its call to " + str(c))
+            return self._finish(TaskStatus.FAILURE)
+        return TaskStatus.RUNNING
+
+    def reset(self):
+        self._call = None
+        super(Timeout, self).reset()
+
+
+class Retry(TimerTask):
+    """
+        Run the child again when it fails, up to attempts times in total,
+        waiting backoff * 2^n seconds (at most max_delay) before retry n.
+    """
+
+    def __init__(self, name, attempts=3, backoff=0.1, max_delay=5.0, *args, **kwargs):
+        super(Retry, self).__init__(name, *args, **kwargs)
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.attempt = 0
+
+    def run(self):
+        if self._announce:
+            self.announce()
+        c = self.children[0]
+        while True:
+            if self._timer is not None:
+                if self.blocking and not self._expired:
+                    self._event.wait()
+                if self.timer_pending():
+                    return TaskStatus.RUNNING
+                self._timer = None
+                c.reset()
+
+            c.status = c.run()
+            self.touch(c)
+            if c.status != TaskStatus.FAILURE or self.attempt + 1 >= self.attempts:
+                if c.status != TaskStatus.RUNNING:
+                    self.attempt = 0
+                return c.status
+
+            delay = min(self.max_delay, self.backoff * 2 ** self.attempt)
+            self.attempt += 1
+            log.info(self.name + " failed, retry " + str(self.attempt) + " in " + str(delay) + "s")
+            self.start_timer(delay)
+
+    def reset(self):
+        self.attempt = 0
+        super(Retry, self).reset()
+
+
+class RateLimit(TimerTask):
+    """
+        Run the child at most once every interval seconds.  While the limit
+        holds, a non-blocking RateLimit returns RUNNING and a blocking one
+        waits for the next slot.
+    """
+
+    def __init__(self, name, interval, *args, **kwargs):
+        super(RateLimit, self).__init__(name, *args, **kwargs)
+        self.interval = interval
+
+    def run(self):
+        if self._announce:
+            self.announce()
+        c = self.children[0]
+        if self.timer_pending():
+            if not self.blocking:
+                return TaskStatus.RUNNING
+            self._event.wait()
+
+        c.status = c.run()
+        self.touch(c)
+        if c.status != TaskStatus.RUNNING:
+            self.start_timer(self.interval)
+        return c.status
+
+    def reset(self):
+        # a reset must not lift the rate limit
+        timer = self._timer
+        self._timer = None
+        super(RateLimit, self).reset()
+        self._timer = timer
+
+
 class CallbackTask(Task):
     """
         Turn any callback function (cb) into a task
@@ -300,3 +646,15 @@ class CallbackTask(Task):
 
     def reset(self):
         self.status = None
+
+
+def run_until_done(task, interval=0.01):
+    """
+        Run task until it stops returning RUNNING, checking back every
+        interval seconds, e.g. to dance a whole figure on one beat.
+    """
+    task.status = task.run()
+    while task.status == TaskStatus.RUNNING:
+        time.sleep(interval)
+        task.status = task.run()
+    return task.status
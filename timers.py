@@ -0,0 +1,141 @@
+import time
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class Timer(object):
+    """ A callback scheduled on a TimerWheel """
+
+    def __init__(self, expires, callback, args):
+        self.expires = expires
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerWheel(object):
+    """
+        Hierarchical timing wheel.  Time advances in ticks of resolution
+        seconds; level 0 has one slot per tick and every higher level one
+        slot per full turn of the level below.  Scheduling and cancelling
+        are O(1), and each tick only looks at one slot, so thousands of
+        pending timers cost the same per tick as one.  Timers further away
+        than the top level can hold wait in an overflow list.
+
+        Callbacks run on the thread that advances the wheel and must be
+        quick, e.g. setting an event.
+    """
+
+    def __init__(self, resolution=0.01, slots=64, levels=4, clock=time.time):
+        self.resolution = resolution
+        self.slots = slots
+        self.levels = levels
+        self.clock = clock
+        self.wheels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self.overflow = []
+        self.tick = 0
+        self.pending = 0
+        self._start = clock()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _insert(self, timer):
+        delta = timer.expires - self.tick
+        span = self.slots
+        unit = 1
+        for level in range(self.levels):
+            if delta < span:
+                self.wheels[level][(timer.expires // unit) % self.slots].append(timer)
+                return
+            unit = span
+            span *= self.slots
+        self.overflow.append(timer)
+
+    def _cascade(self):
+        unit = 1
+        for level in range(1, self.levels):
+            unit *= self.slots
+            if self.tick % unit:
+                return
+            index = (self.tick // unit) % self.slots
+            timers = self.wheels[level][index]
+            self.wheels[level][index] = []
+            for t in timers:
+                self._insert(t)
+        if self.tick % (unit * self.slots) == 0:
+            timers = self.overflow
+            self.overflow = []
+            for t in timers:
+                self._insert(t)
+
+    def schedule(self, delay, callback, *args):
+        """
+            Call callback(*args) after delay seconds.  Returns a Timer that
+            can be cancelled.
+        """
+        ticks = max(1, int(-(-delay // self.resolution)))  # round up
+        with self._lock:
+            timer = Timer(self.tick + ticks, callback, args)
+            self._insert(timer)
+            self.pending += 1
+        return timer
+
+    def advance(self, now=None):
+        """
+            Move the wheel up to now and run the callbacks that expired.
+        """
+        if now is None:
+            now = self.clock()
+        target = int((now - self._start) / self.resolution)
+        while True:
+            with self._lock:
+                if self.tick >= target:
+                    return
+                self.tick += 1
+                self._cascade()
+                index = self.tick % self.slots
+                expired = self.wheels[0][index]
+                self.wheels[0][index] = []
+                self.pending -= len(expired)
+            for t in expired:
+                if not t.cancelled:
+                    try:
+                        t.callback(*t.args)
+                    except Exception as e:
+                        log.error(e)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.resolution):
+            self.advance()
+
+
+_wheel = None
+_wheel_lock = threading.Lock()
+
+
+def default_wheel():
+    """
+        The timer wheel shared by all trees in the process, started on
+        first use.
+    """
+    global _wheel
+    with _wheel_lock:
+        if _wheel is None:
+            _wheel = TimerWheel().start()
+        return _wheel